@@ -11,11 +11,14 @@ Usage:
 Requirements:
     - nbtlib (pip install nbtlib)
     - Pillow (pip install Pillow)
+    - NumPy (pip install numpy)
 """
 
 import sys
 import os
+import re
 import argparse
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple, cast
 
@@ -26,6 +29,12 @@ except ImportError:
     print("Error: nbtlib is required. Install it with: pip install nbtlib")
     sys.exit(1)
 
+try:
+    import numpy as np
+except ImportError:
+    print("Error: NumPy is required. Install it with: pip install numpy")
+    sys.exit(1)
+
 try:
     from PIL import Image
 except ImportError:
@@ -40,6 +49,16 @@ except ImportError:
     cairosvg = None
     SVG_SUPPORT = False
 
+# Legacy per-pixel flag keys, e.g. ColorR-X3-Y7
+LEGACY_COLOR_KEY = re.compile(r'Color([RGB])-X(\d+)-Y(\d+)')
+LEGACY_CHANNELS = {'R': 0, 'G': 1, 'B': 2}
+
+
+@lru_cache(maxsize=None)
+def _frow_keys(height: int) -> Tuple[str, ...]:
+    """FRow tag names for a flag of the given height, built once per height."""
+    return tuple(f'FRow{i}' for i in range(height))
+
 
 class FlagData:
     """Represents flag data as stored in Galacticraft NBT format."""
@@ -47,8 +66,8 @@ class FlagData:
     def __init__(self, width: int = 0, height: int = 0):
         self.width = width
         self.height = height
-        # Color array: [x][y][rgb] where rgb are signed bytes (-128 to 127)
-        self.colors = [[[0, 0, 0] for _ in range(height)] for _ in range(width)]
+        # Color array: [x, y, rgb] where rgb are signed bytes (-128 to 127)
+        self.colors = np.zeros((width, height, 3), dtype=np.int8)
     
     @classmethod
     def from_nbt(cls, nbt_data: nbtlib.Compound) -> 'FlagData':
@@ -59,25 +78,23 @@ class FlagData:
             height = int(nbt_data['FHeight'])
             flag = cls(width, height)
             
-            for i in range(height):
-                color_row_key = f'FRow{i}'
-                if color_row_key in nbt_data:
-                    color_row = nbt_data[color_row_key]
-                    for j in range(width):
-                        if j < len(color_row):
-                            color = int(color_row[j])
-                            # Extract RGB from 32-bit color
-                            # Java casts to byte: (byte)(color >> 16)
-                            # This means: if value >= 128, it becomes negative in signed byte
-                            # We need to match Java's (byte) cast behavior
-                            r = (color >> 16) & 0xFF
-                            g = (color >> 8) & 0xFF
-                            b = color & 0xFF
-                            # Convert unsigned byte (0-255) to signed byte (-128 to 127)
-                            # Values 0-127 stay the same, 128-255 become -128 to -1
-                            flag.colors[j][i][0] = r if r < 128 else r - 256
-                            flag.colors[j][i][1] = g if g < 128 else g - 256
-                            flag.colors[j][i][2] = b if b < 128 else b - 256
+            # Packed 0x00RRGGBB colors, one row per FRow tag. IntArray tags are
+            # big-endian int32 arrays, so matching their dtype makes each row a
+            # single buffer copy. Missing or short rows are left as zero,
+            # matching the default flag colors.
+            rows = np.zeros((height, width), dtype='>i4')
+            for i, color_row_key in enumerate(_frow_keys(height)):
+                color_row = nbt_data.get(color_row_key)
+                if color_row is not None:
+                    n = min(len(color_row), width)
+                    rows[i, :n] = color_row[:n]
+            
+            # Extract RGB from 32-bit color
+            # Java casts to byte: (byte)(color >> 16), so values 128-255 become
+            # -128 to -1, which is just the color's bytes read as signed.
+            # Big-endian, so the bytes of each color are 0x00, R, G, B
+            color_bytes = rows.view(np.int8).reshape(height, width, 4)
+            flag.colors[:] = color_bytes[:, :, 1:].transpose(1, 0, 2)
             
             return flag
         
@@ -87,18 +104,14 @@ class FlagData:
             height = int(nbt_data['FlagHeight'])
             flag = cls(width, height)
             
-            for i in range(width):
-                for j in range(height):
-                    r_key = f'ColorR-X{i}-Y{j}'
-                    g_key = f'ColorG-X{i}-Y{j}'
-                    b_key = f'ColorB-X{i}-Y{j}'
-                    
-                    if r_key in nbt_data:
-                        flag.colors[i][j][0] = int(nbt_data[r_key])
-                    if g_key in nbt_data:
-                        flag.colors[i][j][1] = int(nbt_data[g_key])
-                    if b_key in nbt_data:
-                        flag.colors[i][j][2] = int(nbt_data[b_key])
+            # Single pass over the compound instead of probing every key
+            for key, value in nbt_data.items():
+                match = LEGACY_COLOR_KEY.fullmatch(key)
+                if match is None:
+                    continue
+                i, j = int(match.group(2)), int(match.group(3))
+                if i < width and j < height:
+                    flag.colors[i, j, LEGACY_CHANNELS[match.group(1)]] = int(value)
             
             return flag
         
@@ -110,30 +123,22 @@ class FlagData:
         nbt_data['FWidth'] = nbtlib.Int(self.width)
         nbt_data['FHeight'] = nbtlib.Int(self.height)
         
-        for i in range(self.height):
-            color_row = []
-            for j in range(self.width):
-                # Convert RGB to 32-bit color
-                r = (self.colors[j][i][0] + 128) & 0xFF
-                g = (self.colors[j][i][1] + 128) & 0xFF
-                b = (self.colors[j][i][2] + 128) & 0xFF
-                color_32bit = (r << 16) | (g << 8) | b
-                color_row.append(color_32bit)
-            
-            nbt_data[f'FRow{i}'] = nbtlib.IntArray(color_row)
+        # Convert RGB to 32-bit color: the big-endian bytes of each color are
+        # 0x00, R, G, B, with the signed bytes offset by 128 (uint8 wraps)
+        color_bytes = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        color_bytes[:, :, 1:] = self.colors.transpose(1, 0, 2).view(np.uint8) + 128
+        rows = color_bytes.view('>i4').reshape(self.height, self.width)
+
+        # IntArray keeps the '>i4' rows as-is, so no per-pixel Python ints
+        for color_row_key, row in zip(_frow_keys(self.height), rows):
+            nbt_data[color_row_key] = nbtlib.IntArray(row)
     
     def to_image(self) -> Image.Image:
         """Convert flag data to PIL Image."""
-        img = Image.new('RGB', (self.width, self.height))
-        
-        for x in range(self.width):
-            for y in range(self.height):
-                r = (self.colors[x][y][0] + 128) & 0xFF
-                g = (self.colors[x][y][1] + 128) & 0xFF
-                b = (self.colors[x][y][2] + 128) & 0xFF
-                img.putpixel((x, y), (r, g, b))
-        
-        return img
+        # Offset signed bytes by 128 (uint8 wraps like & 0xFF), then lay out
+        # as rows of pixels for Pillow
+        rgb = self.colors.astype(np.uint8) + 128
+        return Image.fromarray(np.ascontiguousarray(rgb.transpose(1, 0, 2)))
     
     @classmethod
     def from_image(cls, img: Image.Image, target_width: int = 48, target_height: int = 32,
@@ -144,40 +149,46 @@ class FlagData:
         target dimensions (current behavior). If True, the image is scaled to fit while
         preserving aspect ratio and pasted centered onto a black background of the
         target size.
+
+        The image is not copied first: JPEG decoding may be drafted at a lower
+        resolution, and in preserve_aspect mode an RGB image is shrunk in place.
+        Pass a copy if the original is still needed.
         """
+        # Let decoders that support it (JPEG) scale down by a power of two while
+        # loading, keeping at least 3x the target size for the Lanczos pass
+        img.draft('RGB', (target_width * 3, target_height * 3))
+
         # Convert to RGB if needed
         if img.mode != 'RGB':
             img = img.convert('RGB')
 
+        flag = cls(target_width, target_height)
+
         if preserve_aspect:
-            # Scale preserving aspect ratio and paste onto black background
-            # Make a copy so we don't mutate the original
-            working = img.copy()
-            working.thumbnail((target_width, target_height), Image.Resampling.LANCZOS)
-
-            background = Image.new('RGB', (target_width, target_height), (0, 0, 0))
-            offset_x = (target_width - working.width) // 2
-            offset_y = (target_height - working.height) // 2
-            background.paste(working, (offset_x, offset_y))
-            img_to_sample = background
+            # Scale preserving aspect ratio and center on the flag. The color
+            # buffer starts zeroed, which is already the black background.
+            img.thumbnail((target_width, target_height), Image.Resampling.LANCZOS)
+
+            offset_x = (target_width - img.width) // 2
+            offset_y = (target_height - img.height) // 2
+            img_to_sample = img
         else:
-            # Stretch to fill target dimensions (existing behavior)
+            # Stretch to fill target dimensions (existing behavior). For large
+            # sources, reducing_gap box-reduces by an integer factor first so
+            # Lanczos only runs on a small intermediate (thumbnail does the
+            # same by default).
+            offset_x = offset_y = 0
             if img.size != (target_width, target_height):
-                img_to_sample = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
+                img_to_sample = img.resize((target_width, target_height), Image.Resampling.LANCZOS,
+                                           reducing_gap=3.0)
             else:
                 img_to_sample = img
 
-        flag = cls(target_width, target_height)
-
-        for x in range(target_width):
-            for y in range(target_height):
-                # getpixel will be an RGB triplet after conversion
-                pixel = cast(Tuple[int, int, int], img_to_sample.getpixel((x, y)))
-                r, g, b = pixel
-                # Convert unsigned byte (0-255) to signed byte (-128 to 127)
-                flag.colors[x][y][0] = r if r < 128 else r - 256
-                flag.colors[x][y][1] = g if g < 128 else g - 256
-                flag.colors[x][y][2] = b if b < 128 else b - 256
+        # (height, width, 3) RGB triplets after conversion
+        pixels = np.asarray(img_to_sample, dtype=np.uint8)
+        # Reinterpret unsigned bytes (0-255) as signed bytes (-128 to 127)
+        flag.colors[offset_x:offset_x + img_to_sample.width,
+                    offset_y:offset_y + img_to_sample.height] = pixels.view(np.int8).transpose(1, 0, 2)
 
         return flag
 
@@ -327,13 +338,6 @@ class SpaceRaceEditor:
         # Create data directory if it doesn't exist
         self.data_path.mkdir(exist_ok=True)
         
-        # Create backup of original file
-        if space_race_file.exists():
-            import shutil
-            backup_file = self.data_path / "GCSpaceRaceData.dat.backup"
-            shutil.copy2(space_race_file, backup_file)
-            print(f"Backup created: {backup_file}")
-        
         # Use the original NBT file structure if it exists, otherwise create new
         if self.space_race_nbt_file is not None:
             root = self.space_race_nbt_file
@@ -350,8 +354,31 @@ class SpaceRaceEditor:
         
         root['data']['SpaceRaceList'] = race_list
         
-        # Save to file
-        root.save(str(space_race_file))
+        # Write to a temporary file and swap it in atomically, so the original
+        # stays in place if anything fails
+        temp_file = self.data_path / "GCSpaceRaceData.dat.tmp"
+        try:
+            root.save(str(temp_file))
+            
+            # Create backup of original file. A hard link avoids copying its
+            # bytes and keeps GCSpaceRaceData.dat in place until the replace.
+            if space_race_file.exists():
+                backup_file = self.data_path / "GCSpaceRaceData.dat.backup"
+                if backup_file.exists():
+                    backup_file.unlink()
+                try:
+                    os.link(space_race_file, backup_file)
+                except OSError:
+                    # Filesystem without hard links
+                    import shutil
+                    shutil.copy2(space_race_file, backup_file)
+                print(f"Backup created: {backup_file}")
+            
+            os.replace(temp_file, space_race_file)
+        finally:
+            # Only still there if something above failed
+            if temp_file.exists():
+                temp_file.unlink()
         print(f"Space race data saved to {space_race_file}")
     
     def list_races(self):
@@ -393,19 +420,39 @@ class SpaceRaceEditor:
                 print("Alternatively, convert your SVG to PNG first.")
                 sys.exit(1)
             
-            # Convert SVG to PNG in memory (always 48x32)
+            # Convert SVG to PNG in memory, rasterized close to the flag size
             import io
             # Ensure cairosvg is available (static analyzer) and that svg2png returns bytes
             assert cairosvg is not None, "cairosvg must be available for SVG conversion"
-            png_data = cast(bytes, cairosvg.svg2png(url=image_path))
-            if png_data is None:
-                raise RuntimeError("Failed to render SVG to PNG")
-            img = Image.open(io.BytesIO(png_data))
+
+            def render_svg(**output_size) -> Image.Image:
+                png_data = cast(bytes, cairosvg.svg2png(url=image_path, **output_size))
+                if png_data is None:
+                    raise RuntimeError("Failed to render SVG to PNG")
+                return Image.open(io.BytesIO(png_data))
+
+            # Only one output dimension is passed so cairosvg keeps the SVG's
+            # aspect ratio; with both it letterboxes instead of stretching.
+            # Render to the flag width, then switch to the flag height if the
+            # result is too tall to fit (pad) or too short to cover (stretch).
+            # from_image then pads or stretches it as for any other image.
+            try:
+                img = render_svg(output_width=width)
+                if preserve_aspect:
+                    use_height = img.height > height
+                else:
+                    use_height = img.height < height
+                if use_height:
+                    img = render_svg(output_height=height)
+            except ValueError:
+                # Extreme aspect ratios round one side to 0 px at flag size;
+                # render at the SVG's own size instead
+                img = render_svg()
         else:
             img = Image.open(image_path)
         
         race = self.space_races[race_index]
-        race.flag_data = FlagData.from_image(img, 48, 32, preserve_aspect=preserve_aspect)
+        race.flag_data = FlagData.from_image(img, width, height, preserve_aspect=preserve_aspect)
         mode_str = 'pad (preserve aspect ratio, black background)' if preserve_aspect else 'stretch (fill target size)'
         print(f"Flag imported from {image_path} using mode: {mode_str}")
         print(f"Applied to Space Race #{race.space_race_id}: {race.team_name}")